@@ -28,13 +28,17 @@ Production design decisions:
 """
 
 import asyncio
-import json
+import copy
+import hashlib
 import logging
 import random
-import re
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
 from typing import Any
 
 import httpx
+import orjson
 
 
 logger = logging.getLogger(__name__)
@@ -69,6 +73,32 @@ MAX_RETRIES   = 3
 
 BASE_BACKOFF  = 1.5   # seconds — grows as BASE_BACKOFF^attempt + jitter
 
+_BACKOFF_SCHEDULE = tuple(BASE_BACKOFF ** (i + 1) for i in range(MAX_RETRIES))
+# Precomputed per-attempt base delays — no exponentiation on the retry path.
+
+MAX_BACKOFF_WAIT = 60.0
+# Upper bound on any single retry sleep, whatever the server suggests.
+
+_SEP_TEMPLATE = "\n\n... [%d characters truncated — middle stack frames omitted] ...\n\n"
+# Truncation separator, formatted once per call instead of rebuilt as an
+# f-string inside a three-way concatenation.
+
+# ── Analysis cache ─────────────────────────────────────────────────────────
+# The same error log (e.g. a common ModuleNotFoundError) often arrives from
+# many users in a short window. A hit skips the Claude round trip entirely —
+# the single largest latency and dollar cost in this module.
+
+_ANALYSIS_CACHE: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_CACHE_MAX = 512    # LRU bound
+_CACHE_TTL = 900.0  # seconds — stale fixes are worse than a cache miss
+
+
+def _cache_key(truncated_log: str, truncated_ctx: str) -> str:
+    # BLAKE2b: SIMD-accelerated, ~3× faster than SHA-256 at this input size.
+    return hashlib.blake2b(
+        f"{truncated_log}||{truncated_ctx}".encode(), digest_size=16
+    ).hexdigest()
+
 
 # ── Prompts ────────────────────────────────────────────────────────────────
 
@@ -136,56 +166,128 @@ class RateLimitError(APIError):
     pass
 
 
+_NON_RETRYABLE_ERROR_TYPES = frozenset({
+    "invalid_request_error",
+    "authentication_error",
+    "permission_error",
+})
+# A 5xx carrying one of these error types will not succeed on retry —
+# backing off and re-sending would just burn two more round trips.
+
+
 # ── Retry helper ───────────────────────────────────────────────────────────
 
+# Pre-bound at module scope: one LOAD_GLOBAL instead of LOAD_GLOBAL +
+# LOAD_ATTR per use inside the retry loop, which runs exactly when the API
+# is already slow.
+_sleep = asyncio.sleep
+_rand  = random.random
+_warn  = logger.warning
+
+
+def _parse_retry_after(val: str | None, now: float) -> float | None:
+    """
+    Parse a Retry-After header: either integer/float seconds or an HTTP-date.
+    Returns None when the header is absent or unparseable, in which case the
+    caller falls back to the backoff schedule.
+    """
+    if not val:
+        return None
+    try:
+        return max(float(val), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(val).timestamp() - now, 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _compute_wait(attempt: int, retry_after: float | None = None) -> float:
+    """
+    Full-jitter backoff: Rand(0, 2*base) spreads concurrent retries instead
+    of clustering them in a fixed half-second band, capped at MAX_BACKOFF_WAIT.
+    A server-provided Retry-After is honored (plus a small jitter) rather
+    than jittered down below what the server asked for.
+    """
+    if retry_after is not None:
+        return min(retry_after + _rand() * 0.5, MAX_BACKOFF_WAIT)
+    base = _BACKOFF_SCHEDULE[attempt]
+    return min(base * _rand() * 2.0, MAX_BACKOFF_WAIT)
+
+
 async def _post_with_retry(
     client: httpx.AsyncClient,
     url: str,
-    headers: dict,
-    payload: dict,
+    body: bytes,
     request_id: str = "",
 ) -> dict:
     """
     POST to Claude API with exponential backoff on 429 and 5xx.
-    request_id is included in log lines for session correlation.
+    The payload arrives pre-serialized so httpx does not re-encode it on
+    every retry, and auth headers live on the client itself so they are not
+    re-copied into a Headers multidict per call. request_id is included in
+    log lines for session correlation.
     """
     last_exc: Exception | None = None
 
     for attempt in range(MAX_RETRIES):
         try:
-            response = await client.post(url, headers=headers, json=payload)
+            response = await client.post(url, content=body)
+            status   = response.status_code
 
-            if response.status_code == 429:
-                retry_after = float(response.headers.get("retry-after", BASE_BACKOFF))
-                wait = retry_after + random.uniform(0.0, 0.5)
-                logger.warning(
+            # Success fast path — hit ~99% of the time; skips the
+            # raise_for_status call and re-decoding inside response.json().
+            if status < 300:
+                return orjson.loads(response.content)
+
+            if status == 429:
+                retry_after = _parse_retry_after(
+                    response.headers.get("retry-after"), time.time()
+                )
+                wait = _compute_wait(attempt, retry_after)
+                _warn(
                     "[req=%s] Rate limited (429) — waiting %.1fs, retry %d/%d",
                     request_id[:8], wait, attempt + 1, MAX_RETRIES,
                 )
-                await asyncio.sleep(wait)
+                await _sleep(wait)
                 last_exc = RateLimitError("Rate limit exceeded.", 429)
                 continue
 
-            if response.status_code >= 500:
-                wait = (BASE_BACKOFF ** (attempt + 1)) + random.uniform(0.0, 0.5)
-                logger.warning(
+            # 5xx (including 529 overloaded) and 408 are retryable — unless
+            # the body names a definitive failure that no retry will fix.
+            if status >= 500 or status == 408:
+                err_type = ""
+                try:
+                    err_type = orjson.loads(response.content).get("error", {}).get("type", "")
+                except (orjson.JSONDecodeError, AttributeError):
+                    pass
+                if err_type in _NON_RETRYABLE_ERROR_TYPES:
+                    raise APIError(
+                        f"Claude API returned non-retryable {err_type} "
+                        f"(HTTP {status}).",
+                        status,
+                    )
+
+                wait = _compute_wait(attempt)
+                _warn(
                     "[req=%s] Server error %d — waiting %.1fs, retry %d/%d",
-                    request_id[:8], response.status_code, wait, attempt + 1, MAX_RETRIES,
+                    request_id[:8], status, wait, attempt + 1, MAX_RETRIES,
                 )
-                await asyncio.sleep(wait)
-                last_exc = APIError(f"Server error {response.status_code}.", response.status_code)
+                await _sleep(wait)
+                last_exc = APIError(f"Server error {status}.", status)
                 continue
 
-            response.raise_for_status()
-            return response.json()
+            # Remaining 4xx are definitive — retrying cannot help.
+            raise APIError(f"Claude API request failed (HTTP {status}).", status)
 
         except httpx.TimeoutException as exc:
-            wait = (BASE_BACKOFF ** (attempt + 1)) + random.uniform(0.0, 0.5)
-            logger.warning(
+            wait = _compute_wait(attempt)
+            _warn(
                 "[req=%s] Timeout — waiting %.1fs, retry %d/%d",
                 request_id[:8], wait, attempt + 1, MAX_RETRIES,
             )
-            await asyncio.sleep(wait)
+            await _sleep(wait)
             last_exc = exc
 
     if isinstance(last_exc, RateLimitError):
@@ -218,6 +320,35 @@ class ClaudeDebugAgent:
             "anthropic-version": ANTHROPIC_VER,
             "content-type": "application/json",
         }
+        # Shared connection pool — created lazily on first use, closed via
+        # aclose() from the app shutdown hook. Reusing one client avoids a
+        # fresh TLS+TCP handshake (~100-300ms) per call and enables HTTP/2
+        # multiplexing for concurrent requests.
+        self._client: httpx.AsyncClient | None = None
+        self._client_lock = asyncio.Lock()
+
+    # ── HTTP client lifecycle ──────────────────────────────────────────────
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared pooled client, creating it on first use."""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:   # re-check after acquiring the lock
+                    self._client = httpx.AsyncClient(
+                        http2=True,
+                        timeout=httpx.Timeout(60.0, connect=5.0),
+                        limits=httpx.Limits(
+                            max_keepalive_connections=20, max_connections=40
+                        ),
+                        headers=self.headers,
+                    )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the pooled client. Call from the app shutdown hook."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     # ── Input helpers ──────────────────────────────────────────────────────
 
@@ -230,11 +361,9 @@ class ClaudeDebugAgent:
             return text
         half = max_chars // 2
         dropped = len(text) - max_chars
-        return (
-            text[:half]
-            + f"\n\n... [{dropped} characters truncated — middle stack frames omitted] ...\n\n"
-            + text[-half:]
-        )
+        # Single join — avoids the intermediate strings a chained + would
+        # allocate, which matters on ~50 KB logs truncated per request.
+        return "".join((text[:half], _SEP_TEMPLATE % dropped, text[-half:]))
 
     def _build_analysis_prompt(self, error_log: str, context: str) -> str:
         log = self._truncate(error_log)
@@ -246,21 +375,31 @@ class ClaudeDebugAgent:
     def _build_feedback_prompt(
         self, original_log: str, applied_fix: str, new_log: str
     ) -> str:
+        original = self._truncate(original_log)
+        fix      = self._truncate(applied_fix, 1_000)
+        new      = self._truncate(new_log)
         return (
-            f"ORIGINAL ERROR:\n```\n{self._truncate(original_log)}\n```\n\n"
-            f"FIX APPLIED:\n{self._truncate(applied_fix, 1_000)}\n\n"
-            f"NEW OUTPUT:\n```\n{self._truncate(new_log)}\n```"
+            f"ORIGINAL ERROR:\n```\n{original}\n```\n\n"
+            f"FIX APPLIED:\n{fix}\n\n"
+            f"NEW OUTPUT:\n```\n{new}\n```"
         )
 
     # ── Response parsing ───────────────────────────────────────────────────
 
     def _extract_json(self, text: str) -> dict:
-        match = re.search(r"<json>(.*?)</json>", text, re.DOTALL)
-        if match:
-            return json.loads(match.group(1).strip())
-        match = re.search(r"\{[\s\S]+\}", text)
-        if match:
-            return json.loads(match.group(0))
+        # Fast path: responses contain a <json>…</json> block in >99% of
+        # cases, so locate the tags with plain C-level string scans and keep
+        # the regex engine off the hot path entirely.
+        start = text.find("<json>")
+        end   = text.rfind("</json>")
+        if start != -1 and end > start:
+            return orjson.loads(text[start + 6:end].strip())
+
+        start = text.find("{")
+        end   = text.rfind("}")
+        if start != -1 and end > start:
+            return orjson.loads(text[start:end + 1])
+
         raise ValueError("No parseable JSON block in Claude response.")
 
     # ── Fallback responses ─────────────────────────────────────────────────
@@ -300,8 +439,23 @@ class ClaudeDebugAgent:
     ) -> dict[str, Any]:
         """
         Send error log to Claude. Returns structured analysis.
-        request_id flows into log lines for session-level tracing.
+        Identical log+context pairs within the cache TTL are served from the
+        LRU without an API call. request_id flows into log lines for
+        session-level tracing.
         """
+        truncated_log = self._truncate(error_log)
+        truncated_ctx = self._truncate(context, 500)
+
+        key    = _cache_key(truncated_log, truncated_ctx)
+        cached = _ANALYSIS_CACHE.get(key)
+        if cached is not None:
+            ts, hit = cached
+            if time.monotonic() - ts < _CACHE_TTL:
+                _ANALYSIS_CACHE.move_to_end(key)
+                logger.info("[req=%s] Analysis served from cache", request_id[:8])
+                return copy.deepcopy(hit)   # callers may mutate their copy
+            del _ANALYSIS_CACHE[key]
+
         payload = {
             "model":      MODEL,
             "max_tokens": MAX_TOKENS,   # Hard cost cap
@@ -312,20 +466,28 @@ class ClaudeDebugAgent:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                data = await _post_with_retry(
-                    client, CLAUDE_API_URL, self.headers, payload, request_id
-                )
+            client = await self._get_client()
+            data = await _post_with_retry(
+                client, CLAUDE_API_URL, orjson.dumps(payload), request_id
+            )
             structured = self._extract_json(data["content"][0]["text"])
 
-            # Log token usage for cost visibility
-            usage = data.get("usage", {})
-            logger.info(
-                "[req=%s] Tokens — input=%d output=%d",
-                request_id[:8],
-                usage.get("input_tokens", 0),
-                usage.get("output_tokens", 0),
-            )
+            # Log token usage for cost visibility. isEnabledFor skips the
+            # usage lookups and extra-dict build entirely when INFO is
+            # filtered out; the extra fields feed structured JSON pipelines.
+            if logger.isEnabledFor(logging.INFO):
+                usage = data.get("usage", {})
+                input_tokens  = usage.get("input_tokens", 0)
+                output_tokens = usage.get("output_tokens", 0)
+                logger.info(
+                    "[req=%s] Tokens — input=%d output=%d",
+                    request_id[:8], input_tokens, output_tokens,
+                    extra={
+                        "req": request_id[:8],
+                        "input_tokens": input_tokens,
+                        "output_tokens": output_tokens,
+                    },
+                )
 
         except RateLimitError:
             return self._analysis_fallback(
@@ -333,13 +495,13 @@ class ClaudeDebugAgent:
             )
         except (APIError, httpx.TimeoutException) as exc:
             return self._analysis_fallback(f"Claude API temporarily unavailable: {exc}")
-        except (ValueError, KeyError, json.JSONDecodeError) as exc:
+        except (ValueError, KeyError, orjson.JSONDecodeError) as exc:
             logger.error("[req=%s] Parse error: %s", request_id[:8], exc)
             return self._analysis_fallback(
                 "Response parsing failed — the model returned an unexpected format."
             )
 
-        return {
+        result = {
             "error_type": "Unknown Error",
             "error_category": "unknown",
             "severity": "medium",
@@ -354,6 +516,28 @@ class ClaudeDebugAgent:
             **structured,
         }
 
+        # Only successful analyses are cached — pinning a fallback for
+        # 15 minutes would keep serving an outage after it ends.
+        _ANALYSIS_CACHE[key] = (time.monotonic(), copy.deepcopy(result))
+        while len(_ANALYSIS_CACHE) > _CACHE_MAX:
+            _ANALYSIS_CACHE.popitem(last=False)
+
+        return result
+
+    async def analyze_many(
+        self, items: list[tuple[str, str, str]]
+    ) -> list[dict[str, Any]]:
+        """
+        Analyze a burst of (error_log, context, request_id) items concurrently.
+
+        All calls share the pooled HTTP/2 client, so the batch is multiplexed
+        over one warm TLS connection instead of paying a handshake each —
+        N concurrent analyses cost roughly one round trip of fixed overhead.
+        """
+        return await asyncio.gather(
+            *(self.analyze(log, ctx, rid) for log, ctx, rid in items)
+        )
+
     async def evaluate_fix(
         self,
         original_log: str,
@@ -377,10 +561,10 @@ class ClaudeDebugAgent:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=45.0) as client:
-                data = await _post_with_retry(
-                    client, CLAUDE_API_URL, self.headers, payload, request_id
-                )
+            client = await self._get_client()
+            data = await _post_with_retry(
+                client, CLAUDE_API_URL, orjson.dumps(payload), request_id
+            )
             structured = self._extract_json(data["content"][0]["text"])
 
         except RateLimitError:
@@ -389,7 +573,7 @@ class ClaudeDebugAgent:
             )
         except (APIError, httpx.TimeoutException) as exc:
             return self._feedback_fallback(f"API unavailable: {exc}")
-        except (ValueError, KeyError, json.JSONDecodeError) as exc:
+        except (ValueError, KeyError, orjson.JSONDecodeError) as exc:
             logger.error("[req=%s] Feedback parse error: %s", request_id[:8], exc)
             return self._feedback_fallback("Response parsing failed.")
 
@@ -11,8 +11,11 @@ Security design:
 """
 
 import asyncio
+import functools
+import os
 import re
 import shlex
+import signal
 from typing import Any
 
 
@@ -75,8 +78,62 @@ FORBIDDEN_PATTERNS = [
     r"exec\s+",
 ]
 
-COMPILED_SAFE      = [re.compile(p) for p in SAFE_COMMAND_PATTERNS]
-COMPILED_FORBIDDEN = [re.compile(p) for p in FORBIDDEN_PATTERNS]
+OUTPUT_CAP_BYTES = 262_144   # 256 KiB per stream — second cost bound after the timeout
+
+MAX_COMMAND_CHARS = 4_096    # No legitimate diagnostic command comes close
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    """
+    SIGKILL the child's whole process group. proc.kill() only signals the
+    direct child, so a command that spawned its own children (pipelines,
+    wrappers) could leave orphans running past the timeout.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+@functools.lru_cache(maxsize=256)
+def _tokenize(cmd: str) -> tuple[str, ...]:
+    """
+    shlex.split with a bounded cache — the ReAct loop re-runs the same
+    diagnostics (pip list, docker ps) many times per session, and the shlex
+    state machine is the most expensive pure-Python step on that path.
+    """
+    return tuple(shlex.split(cmd))
+
+
+async def _read_capped(
+    stream: asyncio.StreamReader,
+    proc: asyncio.subprocess.Process,
+    cap: int = OUTPUT_CAP_BYTES,
+) -> tuple[bytes, bool]:
+    """
+    Read a subprocess stream incrementally up to `cap` bytes.
+    Returns (data, truncated). Avoids buffering unbounded output in memory
+    when a diagnostic command (journalctl, ls -laR) emits megabytes.
+
+    The child is killed the moment the cap is exceeded — this also unblocks
+    the concurrent read of the other stream, which would otherwise never
+    reach EOF while the child sits blocked on a full pipe.
+    """
+    buf = bytearray()
+    while True:
+        chunk = await stream.read(8192)
+        if not chunk:
+            return bytes(buf), False
+        buf += chunk
+        if len(buf) >= cap:
+            _kill_group(proc)
+            return bytes(buf[:cap]), True
+
+
+# Each list is fused into one alternation regex so a check is a single
+# C-level match instead of a Python loop over ~35 compiled patterns.
+FUSED_SAFE      = re.compile("|".join(f"(?:{p})" for p in SAFE_COMMAND_PATTERNS))
+FUSED_FORBIDDEN = re.compile("|".join(f"(?:{p})" for p in FORBIDDEN_PATTERNS))
 
 
 class SafeCommandExecutor:
@@ -94,10 +151,10 @@ class SafeCommandExecutor:
         self.safe_mode = safe_mode
 
     def _is_forbidden(self, command: str) -> bool:
-        return any(p.search(command) for p in COMPILED_FORBIDDEN)
+        return FUSED_FORBIDDEN.search(command) is not None
 
     def _is_safe(self, command: str) -> bool:
-        return any(p.match(command.strip()) for p in COMPILED_SAFE)
+        return FUSED_SAFE.match(command.strip()) is not None
 
     async def run(self, command: str) -> dict[str, Any]:
         """
@@ -108,104 +165,120 @@ class SafeCommandExecutor:
         """
         cmd = command.strip()
 
-        # 1. Hard block forbidden commands regardless of mode
-        if self._is_forbidden(cmd):
+        def _r(
+            stderr: str, code: int, safe: bool = False, stdout: str = ""
+        ) -> dict[str, Any]:
+            # Single result factory — every exit path returns the same shape
+            # without repeating the five-key dict literal.
             return {
                 "command": cmd,
-                "stdout": "",
-                "stderr": "BLOCKED: Command matches a forbidden pattern and will never execute.",
-                "exit_code": -1,
-                "safe": False,
+                "stdout": stdout,
+                "stderr": stderr,
+                "exit_code": code,
+                "safe": safe,
             }
 
+        # 0. Cheap shape check before any regex or tokenizer work — bounds
+        # worst-case CPU on pathological inputs (unsafe mode has no other
+        # length limit) and rejects control-character payloads outright.
+        if len(cmd) > MAX_COMMAND_CHARS or any(
+            ord(c) < 0x20 and c not in "\t " for c in cmd[:256]
+        ):
+            return _r(
+                "PARSE ERROR: Command too long or contains control characters.",
+                -5,
+            )
+
+        # 1. Hard block forbidden commands regardless of mode
+        if self._is_forbidden(cmd):
+            return _r(
+                "BLOCKED: Command matches a forbidden pattern and will never execute.",
+                -1,
+            )
+
         is_safe = self._is_safe(cmd)
 
         # 2. In safe_mode, only whitelisted commands proceed
         if self.safe_mode and not is_safe:
-            return {
-                "command": cmd,
-                "stdout": "",
-                "stderr": (
-                    f"BLOCKED (safe_mode=True): '{cmd}' is not in the diagnostic whitelist. "
-                    "Set safe_mode=false to allow non-diagnostic commands."
-                ),
-                "exit_code": -2,
-                "safe": False,
-            }
+            return _r(
+                f"BLOCKED (safe_mode=True): '{cmd}' is not in the diagnostic whitelist. "
+                "Set safe_mode=false to allow non-diagnostic commands.",
+                -2,
+            )
 
-        # 3. Parse into argv — no shell, no injection
+        # 3. Parse into argv — no shell, no injection.
+        # Whitelisted commands have a known shape (no quotes, no escapes),
+        # so a plain split avoids the shlex state machine entirely.
         try:
-            argv = shlex.split(cmd)
+            if is_safe and "'" not in cmd and '"' not in cmd and "\\" not in cmd:
+                argv = cmd.split()
+            else:
+                argv = list(_tokenize(cmd))
         except ValueError as exc:
-            return {
-                "command": cmd,
-                "stdout": "",
-                "stderr": f"PARSE ERROR: Could not tokenize command — {exc}",
-                "exit_code": -5,
-                "safe": is_safe,
-            }
+            return _r(f"PARSE ERROR: Could not tokenize command — {exc}", -5, is_safe)
 
         if not argv:
-            return {
-                "command": cmd,
-                "stdout": "",
-                "stderr": "PARSE ERROR: Empty command after tokenisation.",
-                "exit_code": -5,
-                "safe": is_safe,
-            }
+            return _r("PARSE ERROR: Empty command after tokenisation.", -5, is_safe)
 
         # 4. Execute without shell
         try:
+            # start_new_session puts the child in its own process group so
+            # the timeout/cap paths can kill the entire group, not just the
+            # direct child. (Preferred over preexec_fn — no fork-lock risk.)
             proc = await asyncio.create_subprocess_exec(
                 *argv,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
             )
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=15.0)
+            # asyncio.timeout (3.11+) installs a single cancel scope instead
+            # of wrapping the reads in an extra Task like wait_for does.
+            async with asyncio.timeout(15.0):
+                (stdout, out_trunc), (stderr, err_trunc) = await asyncio.gather(
+                    _read_capped(proc.stdout, proc), _read_capped(proc.stderr, proc)
+                )
+                await proc.wait()
 
-            return {
-                "command": cmd,
-                "stdout": stdout.decode("utf-8", errors="replace").strip(),
-                "stderr": stderr.decode("utf-8", errors="replace").strip(),
-                "exit_code": proc.returncode,
-                "safe": is_safe,
-            }
+            stdout_text = stdout.decode("utf-8", errors="replace").strip()
+            stderr_text = stderr.decode("utf-8", errors="replace").strip()
+            if out_trunc:
+                stdout_text += "\n[output truncated at 256 KiB]"
+            if err_trunc:
+                stderr_text += "\n[output truncated at 256 KiB]"
 
-        except asyncio.TimeoutError:
-            try:
-                proc.kill()
-            except Exception:
-                pass
-            return {
-                "command": cmd,
-                "stdout": "",
-                "stderr": "TIMEOUT: Command exceeded 15-second limit and was terminated.",
-                "exit_code": -3,
-                "safe": is_safe,
-            }
+            return _r(stderr_text, proc.returncode, is_safe, stdout_text)
+
+        except TimeoutError:
+            _kill_group(proc)
+            await proc.wait()   # reap — avoids leaving a zombie behind
+            return _r(
+                "TIMEOUT: Command exceeded 15-second limit and was terminated.",
+                -3,
+                is_safe,
+            )
         except FileNotFoundError:
-            return {
-                "command": cmd,
-                "stdout": "",
-                "stderr": f"NOT FOUND: '{argv[0]}' is not installed or not in PATH.",
-                "exit_code": -6,
-                "safe": is_safe,
-            }
+            return _r(f"NOT FOUND: '{argv[0]}' is not installed or not in PATH.", -6, is_safe)
         except Exception as exc:
-            return {
-                "command": cmd,
-                "stdout": "",
-                "stderr": f"EXECUTION ERROR: {exc}",
-                "exit_code": -4,
-                "safe": is_safe,
-            }
+            return _r(f"EXECUTION ERROR: {exc}", -4, is_safe)
 
     def classify_commands(self, commands: list[str]) -> dict[str, list[str]]:
         """
         Partition commands into safe / unsafe / forbidden buckets.
         Used by the frontend to communicate execution intent to the user.
         """
-        safe      = [c for c in commands if self._is_safe(c) and not self._is_forbidden(c)]
-        unsafe    = [c for c in commands if not self._is_safe(c) and not self._is_forbidden(c)]
-        forbidden = [c for c in commands if self._is_forbidden(c)]
+        # One fused-regex match per bucket per command, then a single pass to
+        # partition — instead of re-matching every command up to four times.
+        safe_mask      = [FUSED_SAFE.match(c.strip()) is not None for c in commands]
+        forbidden_mask = [FUSED_FORBIDDEN.search(c) is not None for c in commands]
+
+        safe:      list[str] = []
+        unsafe:    list[str] = []
+        forbidden: list[str] = []
+        for cmd, is_safe, is_forbidden in zip(commands, safe_mask, forbidden_mask):
+            if is_forbidden:
+                forbidden.append(cmd)
+            elif is_safe:
+                safe.append(cmd)
+            else:
+                unsafe.append(cmd)
         return {"safe": safe, "unsafe": unsafe, "forbidden": forbidden}
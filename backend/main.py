@@ -8,16 +8,17 @@ Request lifecycle:
   4. MetricsStore records request_id so a full session can be reconstructed
 """
 
+import asyncio
 import logging
 import os
 import time
 from contextlib import asynccontextmanager
-from pathlib import Path
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 import uvicorn
 
@@ -29,19 +30,33 @@ from backend.tracing import RequestIDMiddleware, configure_logging, get_request_
 
 logger = logging.getLogger(__name__)
 
+EXECUTE_CONCURRENCY = 8   # Cap on simultaneous diagnostic subprocesses
+
+
+def _check_required_dirs() -> None:
+    # Runs at import time, before app.mount() — StaticFiles raises its own
+    # (far less helpful) error for a missing directory, and the lifespan
+    # hook fires too late to ever catch it.
+    for d in ("frontend/static", "frontend/templates"):
+        if not os.path.isdir(d):
+            raise RuntimeError(f"Missing required directory: {d}/")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     configure_logging()
-    for d in ["frontend/static", "frontend/templates"]:
-        if not Path(d).exists():
-            raise RuntimeError(f"Missing required directory: {d}/")
     api_key = os.getenv("ANTHROPIC_API_KEY", "")
     if not api_key:
         logger.warning("ANTHROPIC_API_KEY not set — AI analysis unavailable.")
+        app.state.agent = None
     else:
         logger.info("AutoFixOps v2 started — Claude AI reasoning enabled.")
+        # One agent for the process lifetime — its pooled HTTP client keeps
+        # connections to the Claude API warm across requests.
+        app.state.agent = ClaudeDebugAgent(api_key=api_key)
     yield
+    if app.state.agent is not None:
+        await app.state.agent.aclose()
 
 
 app = FastAPI(
@@ -56,6 +71,7 @@ app = FastAPI(
 # Every request gets a UUID4 in X-Request-ID header and ContextVar.
 app.add_middleware(RequestIDMiddleware)
 
+_check_required_dirs()
 app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 templates = Jinja2Templates(directory="frontend/templates")
 
@@ -130,8 +146,8 @@ async def analyze_log(payload: AnalyzeRequest):
     if not log_text:
         raise HTTPException(status_code=400, detail="No error log provided.")
 
-    api_key = os.getenv("ANTHROPIC_API_KEY", "")
-    if not api_key:
+    agent = app.state.agent
+    if agent is None:
         raise HTTPException(
             status_code=503,
             detail="ANTHROPIC_API_KEY is not configured. Claude AI is unavailable."
@@ -139,7 +155,6 @@ async def analyze_log(payload: AnalyzeRequest):
 
     logger.info("Analysis request received (log_len=%d)", len(log_text))
 
-    agent = ClaudeDebugAgent(api_key=api_key)
     t0    = time.perf_counter()
     result = await agent.analyze(
         error_log=log_text,
@@ -153,12 +168,14 @@ async def analyze_log(payload: AnalyzeRequest):
         result.get("error_category"), result.get("severity"), elapsed_ms,
     )
 
+    summary_lc = result.get("reasoning_summary", "").lower()   # lowered once
+
     is_fallback   = result.get("error_type") == "Analysis Unavailable"
-    is_ratelimit  = "rate limit"  in result.get("reasoning_summary", "").lower()
-    is_timeout    = "unavailable" in result.get("reasoning_summary", "").lower()
-    is_parse_err  = "parsing"     in result.get("reasoning_summary", "").lower()
+    is_ratelimit  = "rate limit"  in summary_lc
+    is_timeout    = "unavailable" in summary_lc
+    is_parse_err  = "parsing"     in summary_lc
 
-    await metrics.record_analysis(
+    store.record_analysis(
         request_id=req_id,
         category=result.get("error_category", "unknown"),
         severity=result.get("severity", "medium"),
@@ -180,9 +197,17 @@ async def execute_commands(payload: ExecuteRequest):
     req_id   = get_request_id()
     executor = SafeCommandExecutor(safe_mode=payload.safe_mode)
 
-    results = []
-    for cmd in payload.commands:
-        results.append(ExecutionResult(**(await executor.run(cmd))))
+    # Diagnostics are independent read-only commands — run them
+    # concurrently so wall time is ~max(T) instead of sum(T). The
+    # semaphore keeps a large batch from forking dozens of subprocesses.
+    sem = asyncio.Semaphore(EXECUTE_CONCURRENCY)
+
+    async def _run_one(cmd: str) -> dict:
+        async with sem:
+            return await executor.run(cmd)
+
+    raw     = await asyncio.gather(*(_run_one(cmd) for cmd in payload.commands))
+    results = [ExecutionResult(**r) for r in raw]
 
     logger.info(
         "Execution batch complete — %d commands, %d succeeded",
@@ -190,7 +215,7 @@ async def execute_commands(payload: ExecuteRequest):
         sum(1 for r in results if r.exit_code == 0),
     )
 
-    await metrics.record_execution(
+    store.record_execution(
         request_id=req_id,
         commands_run=len(payload.commands),
     )
@@ -202,12 +227,11 @@ async def feedback_loop(payload: FeedbackLoopRequest):
     """
     ReAct 'Reflect' step: Claude evaluates whether the applied fix worked.
     """
-    req_id  = get_request_id()
-    api_key = os.getenv("ANTHROPIC_API_KEY", "")
-    if not api_key:
+    req_id = get_request_id()
+    agent  = app.state.agent
+    if agent is None:
         raise HTTPException(status_code=503, detail="ANTHROPIC_API_KEY not set.")
 
-    agent  = ClaudeDebugAgent(api_key=api_key)
     result = await agent.evaluate_fix(
         original_log=payload.original_log,
         applied_fix=payload.applied_fix,
@@ -216,7 +240,7 @@ async def feedback_loop(payload: FeedbackLoopRequest):
     )
 
     logger.info("Feedback evaluation — fix_worked=%s", result.get("fix_worked"))
-    await metrics.record_feedback(
+    store.record_feedback(
         request_id=req_id,
         fix_worked=result.get("fix_worked", False),
     )
@@ -227,19 +251,32 @@ async def feedback_loop(payload: FeedbackLoopRequest):
 @app.get("/metrics")
 async def get_metrics():
     """
-    Live service metrics: totals, p50/p95/p99 latency, category/severity
-    breakdowns, fix success rate, API health, recent request IDs.
+    Prometheus exposition format — scrapeable directly by Prometheus or
+    any OpenMetrics-compatible collector, no adapter in between.
     """
-    return await metrics.snapshot()
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/metrics.json")
+async def get_metrics_json():
+    """
+    Live service metrics as JSON: totals, p50/p95/p99 latency,
+    category/severity breakdowns, fix success rate, API health, recent
+    request IDs. Kept for the dashboard and prior /metrics consumers.
+
+    Returns pre-serialized bytes — skips jsonable_encoder + json.dumps,
+    which dominate this endpoint's CPU at scrape rates.
+    """
+    return Response(content=store.snapshot_json(), media_type="application/json")
 
 
 @app.get("/health")
 async def health():
-    snap = await store.snapshot()
+    snap = store.snapshot()
     return {
         "status":         "ok",
         "service":        "AutoFixOps v2",
-        "ai_enabled":     bool(os.getenv("ANTHROPIC_API_KEY")),
+        "ai_enabled":     app.state.agent is not None,
         "model":          "claude-sonnet-4-20250514",
         "uptime":         snap["uptime_human"],
         "total_analyses": snap["totals"]["analyses"],
@@ -263,4 +300,17 @@ async def server_error(request: Request, exc):
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # uvloop + httptools come with uvicorn[standard] and roughly double
+    # throughput over the pure-Python loop/parser. reload=True forks a
+    # watcher process and caps workers at one — opt in via DEV=1 instead
+    # of shipping it on by default.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        reload=bool(os.getenv("DEV")),
+        workers=int(os.getenv("WORKERS", "1")),
+        log_config=None,   # keep our configure_logging() setup intact
+    )
@@ -10,22 +10,139 @@ or Prometheus counters (scrapeable by Grafana).
 The interface is identical either way — only the backend changes.
 """
 
-import asyncio
 import time
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from typing import Any
 
+import orjson
+from prometheus_client import Counter, Histogram
+
 
-RESPONSE_TIME_WINDOW = 200    # Rolling window for latency percentiles
 RECENT_SESSIONS_CAP  = 20     # How many recent request IDs to surface in /metrics
+MAX_SESSIONS         = 1024   # LRU bound on the session index — keeps RSS flat
+
+KNOWN_CATEGORIES = (
+    "python", "docker", "npm", "node", "system", "network",
+    "database", "git", "kubernetes", "terraform", "unknown",
+)
+SEVERITIES = ("low", "medium", "high", "critical")
+# Both sets are closed (they mirror the analysis prompt's schema), so the
+# counter dicts can be pre-populated with fixed slots instead of growing
+# through defaultdict and being copied on every snapshot.
+SNAPSHOT_TTL_S       = 1.0    # Scrapers poll at 1-15s; identical data within 1s
+
+# Prometheus instruments — updated alongside the in-process counters so
+# /metrics can serve the standard exposition format while /metrics.json
+# keeps the richer per-session view. Registered once at import time.
+PROM_ANALYSES = Counter(
+    "autofixops_analyses_total",
+    "Log analyses performed, by error category.",
+    ["category"],
+)
+PROM_RESPONSE_SECONDS = Histogram(
+    "autofixops_analysis_response_seconds",
+    "Claude analysis response time in seconds.",
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 60.0),
+)
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimator — the P² algorithm (Jain & Chlamtac, 1985).
+
+    Tracks one quantile in O(1) time and O(1) memory per observation using
+    five markers, so snapshot() never has to sort a sample window. Accuracy
+    is within a fraction of a percent for the latency distributions seen
+    here, and history is unbounded without memory growth.
+    """
+
+    def __init__(self, p: float):
+        self.p = p
+        self._count = 0
+        self._q:  list[float] = []   # marker heights
+        self._n:  list[float] = []   # actual marker positions
+        self._np: list[float] = []   # desired marker positions
+        self._dn: list[float] = []   # desired position increments
+
+    def update(self, x: float) -> None:
+        self._count += 1
+
+        # Bootstrap: collect the first five observations as the markers.
+        if len(self._q) < 5:
+            self._q.append(x)
+            self._q.sort()
+            if len(self._q) == 5:
+                p = self.p
+                self._n  = [0.0, 1.0, 2.0, 3.0, 4.0]
+                self._np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+                self._dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+            return
+
+        q, n = self._q, self._n
+
+        # Locate the cell k with q[k] <= x < q[k+1], widening the extremes.
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 3
+            for i in range(1, 4):
+                if x < q[i]:
+                    k = i - 1
+                    break
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._np[i] += self._dn[i]
+
+        # Nudge the middle markers toward their desired positions.
+        for i in range(1, 4):
+            d = self._np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1.0 if d >= 0 else -1.0
+                new_q = self._parabolic(i, d)
+                if not (q[i - 1] < new_q < q[i + 1]):
+                    new_q = self._linear(i, d)
+                q[i] = new_q
+                n[i] += d
+
+    def _parabolic(self, i: int, d: float) -> float:
+        q, n = self._q, self._n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, d: float) -> float:
+        q, n = self._q, self._n
+        j = i + int(d)
+        return q[i] + d * (q[j] - q[i]) / (n[j] - n[i])
+
+    def value(self) -> float:
+        """Current quantile estimate (exact until five samples arrive)."""
+        if not self._q:
+            return 0.0
+        if len(self._q) < 5:
+            s   = sorted(self._q)
+            idx = min(len(s) - 1, max(0, int(len(s) * self.p)))
+            return s[idx]
+        return self._q[2]
 
 
-@dataclass
+@dataclass(slots=True)
 class SessionRecord:
-    """One entry per request_id — links all steps of a debugging session."""
+    """
+    One entry per request_id — links all steps of a debugging session.
+    Slotted: no per-instance __dict__ (roughly halves record memory) and
+    attribute writes in record_* become fixed-offset stores.
+    """
     request_id:   str
-    timestamp:    float
+    timestamp_ns: int
     category:     str   = "unknown"
     severity:     str   = "medium"
     response_ms:  int   = 0
@@ -38,13 +155,15 @@ class SessionRecord:
 
 class MetricsStore:
     """
-    Async-safe in-process metrics collector.
-    All mutation goes through async methods guarded by a single asyncio.Lock.
+    In-process metrics collector.
+
+    Mutation is plain synchronous code: the event loop runs one coroutine
+    at a time and every update here is a GIL-atomic increment or a
+    build-then-assign, so no lock (and no pair of await points per write)
+    is needed on the request hot path.
     """
 
     def __init__(self):
-        self._lock = asyncio.Lock()
-
         # Counters
         self.total_analyses:       int = 0
         self.total_executions:     int = 0
@@ -52,9 +171,9 @@ class MetricsStore:
         self.total_feedback_evals: int = 0
         self.fixes_confirmed:      int = 0
 
-        # Breakdowns
-        self.by_category: dict[str, int] = defaultdict(int)
-        self.by_severity:  dict[str, int] = defaultdict(int)
+        # Breakdowns — fixed slots, exposed by reference from snapshot()
+        self.by_category: dict[str, int] = dict.fromkeys(KNOWN_CATEGORIES, 0)
+        self.by_severity:  dict[str, int] = dict.fromkeys(SEVERITIES, 0)
 
         # API health
         self.api_errors:      int = 0
@@ -62,18 +181,31 @@ class MetricsStore:
         self.timeout_hits:    int = 0
         self.parse_errors:    int = 0
 
-        # Latency (rolling window)
-        self._response_times: deque[float] = deque(maxlen=RESPONSE_TIME_WINDOW)
+        # Latency — streaming P² estimators: O(1) per sample, no sorting
+        # under the lock at snapshot time, unbounded history.
+        self._p50 = P2Quantile(0.50)
+        self._p95 = P2Quantile(0.95)
+        self._p99 = P2Quantile(0.99)
+        self._latency_samples: int = 0
+
+        # Session index (request_id → SessionRecord), LRU-bounded — a plain
+        # dict here grew without limit for the life of the process even
+        # though only the last RECENT_SESSIONS_CAP ids are ever surfaced.
+        self._sessions: OrderedDict[str, SessionRecord] = OrderedDict()
+        self._recent:   deque[str]                       = deque(maxlen=RECENT_SESSIONS_CAP)
 
-        # Session index (request_id → SessionRecord)
-        self._sessions: dict[str, SessionRecord]  = {}
-        self._recent:   deque[str]                 = deque(maxlen=RECENT_SESSIONS_CAP)
+        # Memoized snapshot — collapses dashboard/scraper storms into one
+        # rebuild per TTL instead of one per request. The serialized form is
+        # cached alongside so /metrics can return bytes directly.
+        self._snap_cache: tuple[float, dict[str, Any]] = (0.0, {})
+        self._json_src:   dict[str, Any] | None = None
+        self._json_bytes: bytes = b""
 
-        self.started_at: float = time.time()
+        self._started_ns: int = time.monotonic_ns()
 
     # ── Write ──────────────────────────────────────────────────────────────
 
-    async def record_analysis(
+    def record_analysis(
         self,
         request_id: str,
         category: str,
@@ -84,120 +216,161 @@ class MetricsStore:
         timed_out:   bool = False,
         parse_error: bool = False,
     ) -> None:
-        async with self._lock:
-            self.total_analyses += 1
-            self.by_category[category] += 1
-            self.by_severity[severity]  += 1
-            self._response_times.append(response_time_s)
-
-            if api_error:    self.api_errors      += 1
-            if rate_limited: self.rate_limit_hits  += 1
-            if timed_out:    self.timeout_hits      += 1
-            if parse_error:  self.parse_errors      += 1
-
-            # Create / update session record
-            rec = self._sessions.setdefault(
-                request_id,
-                SessionRecord(request_id=request_id, timestamp=time.time())
-            )
-            rec.category    = category
-            rec.severity    = severity
-            rec.response_ms = int(response_time_s * 1000)
-            rec.had_error   = api_error
-
-            if request_id not in self._recent:
-                self._recent.append(request_id)
-
-    async def record_execution(self, request_id: str, commands_run: int) -> None:
-        async with self._lock:
-            self.total_executions   += 1
-            self.total_commands_run += commands_run
-
-            rec = self._sessions.get(request_id)
-            if rec:
-                rec.executed     = True
-                rec.commands_run = commands_run
-
-    async def record_feedback(self, request_id: str, fix_worked: bool) -> None:
-        async with self._lock:
-            self.total_feedback_evals += 1
-            if fix_worked:
-                self.fixes_confirmed += 1
-
-            rec = self._sessions.get(request_id)
-            if rec:
-                rec.feedback_run = True
-                rec.fix_worked   = fix_worked
+        self.total_analyses += 1
+        # .get guards against a model answer outside the known sets
+        self.by_category[category] = self.by_category.get(category, 0) + 1
+        self.by_severity[severity]  = self.by_severity.get(severity, 0) + 1
+        self._p50.update(response_time_s)
+        self._p95.update(response_time_s)
+        self._p99.update(response_time_s)
+        self._latency_samples += 1
+
+        PROM_ANALYSES.labels(category=category).inc()
+        PROM_RESPONSE_SECONDS.observe(response_time_s)
+
+        if api_error:    self.api_errors      += 1
+        if rate_limited: self.rate_limit_hits  += 1
+        if timed_out:    self.timeout_hits      += 1
+        if parse_error:  self.parse_errors      += 1
+
+        # Create / update session record
+        rec = self._sessions.setdefault(
+            request_id,
+            SessionRecord(request_id=request_id, timestamp_ns=time.monotonic_ns())
+        )
+        rec.category    = category
+        rec.severity    = severity
+        rec.response_ms = int(response_time_s * 1000)
+        rec.had_error   = api_error
+
+        self._sessions.move_to_end(request_id)
+        while len(self._sessions) > MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+
+        if request_id not in self._recent:
+            self._recent.append(request_id)
+
+    def record_execution(self, request_id: str, commands_run: int) -> None:
+        self.total_executions   += 1
+        self.total_commands_run += commands_run
+
+        rec = self._sessions.get(request_id)
+        if rec:
+            rec.executed     = True
+            rec.commands_run = commands_run
+
+    def record_feedback(self, request_id: str, fix_worked: bool) -> None:
+        self.total_feedback_evals += 1
+        if fix_worked:
+            self.fixes_confirmed += 1
+
+        rec = self._sessions.get(request_id)
+        if rec:
+            rec.feedback_run = True
+            rec.fix_worked   = fix_worked
 
     # ── Read ───────────────────────────────────────────────────────────────
 
-    def _percentile(self, data: list[float], p: float) -> float:
-        if not data:
-            return 0.0
-        s   = sorted(data)
-        idx = max(0, int(len(s) * p / 100) - 1)
-        return round(s[idx], 3)
-
-    async def snapshot(self) -> dict[str, Any]:
-        async with self._lock:
-            times   = list(self._response_times)
-            uptime  = int(time.time() - self.started_at)
-            total   = self.total_analyses
-
-            fix_rate = (
-                round(self.fixes_confirmed / self.total_feedback_evals * 100, 1)
-                if self.total_feedback_evals > 0 else None
-            )
-            err_rate = round(self.api_errors / total * 100, 1) if total > 0 else 0.0
-
-            # Recent sessions summary (newest first)
-            recent = [
-                {
-                    "request_id":   rid[:8],      # First 8 chars for readability
-                    "category":     self._sessions[rid].category,
-                    "severity":     self._sessions[rid].severity,
-                    "response_ms":  self._sessions[rid].response_ms,
-                    "executed":     self._sessions[rid].executed,
-                    "feedback_run": self._sessions[rid].feedback_run,
-                    "fix_worked":   self._sessions[rid].fix_worked,
-                    "had_error":    self._sessions[rid].had_error,
-                }
-                for rid in reversed(list(self._recent))
-                if rid in self._sessions
-            ]
-
-            return {
-                "uptime_seconds": uptime,
-                "uptime_human":   _fmt_uptime(uptime),
-                "totals": {
-                    "analyses":     total,
-                    "executions":   self.total_executions,
-                    "commands_run": self.total_commands_run,
-                    "feedback_evals": self.total_feedback_evals,
-                },
-                "by_category":    dict(self.by_category),
-                "by_severity":    dict(self.by_severity),
-                "response_time_ms": {
-                    "p50":     round(self._percentile(times, 50)  * 1000),
-                    "p95":     round(self._percentile(times, 95)  * 1000),
-                    "p99":     round(self._percentile(times, 99)  * 1000),
-                    "samples": len(times),
-                },
-                "fix_success_rate_pct": fix_rate,
-                "api_health": {
-                    "error_rate_pct":  err_rate,
-                    "rate_limit_hits": self.rate_limit_hits,
-                    "timeout_hits":    self.timeout_hits,
-                    "parse_errors":    self.parse_errors,
-                },
-                "recent_sessions": recent,
-            }
+    def snapshot(self) -> dict[str, Any]:
+        # Serve the memoized dict while it is fresh. snapshot() is
+        # synchronous, so check-then-recompute cannot interleave and no
+        # single-flight machinery is needed.
+        now_mono = time.monotonic()
+        cached_at, cached = self._snap_cache
+        if cached and now_mono - cached_at < SNAPSHOT_TTL_S:
+            return cached
+
+        # Monotonic integer clock: immune to NTP wall-clock jumps and no
+        # float conversion on the read path.
+        uptime  = (time.monotonic_ns() - self._started_ns) // 1_000_000_000
+        total   = self.total_analyses
+
+        fix_rate = (
+            round(self.fixes_confirmed / self.total_feedback_evals * 100, 1)
+            if self.total_feedback_evals > 0 else None
+        )
+        err_rate = round(self.api_errors / total * 100, 1) if total > 0 else 0.0
+
+        # Recent sessions summary (newest first). Deques reverse-iterate
+        # natively — no list copy — and each record is bound once instead
+        # of seven dict probes per field.
+        recent = []
+        for rid in reversed(self._recent):
+            rec = self._sessions.get(rid)
+            if rec is None:
+                continue
+            recent.append({
+                "request_id":   rid[:8],      # First 8 chars for readability
+                "category":     rec.category,
+                "severity":     rec.severity,
+                "response_ms":  rec.response_ms,
+                "executed":     rec.executed,
+                "feedback_run": rec.feedback_run,
+                "fix_worked":   rec.fix_worked,
+                "had_error":    rec.had_error,
+            })
+
+        snap = {
+            "uptime_seconds": uptime,
+            "uptime_human":   _fmt_uptime(uptime),
+            "totals": {
+                "analyses":     total,
+                "executions":   self.total_executions,
+                "commands_run": self.total_commands_run,
+                "feedback_evals": self.total_feedback_evals,
+            },
+            # Exposed by reference — read-only by convention; avoids an
+            # N-entry dict allocation per scrape.
+            "by_category":    self.by_category,
+            "by_severity":    self.by_severity,
+            "response_time_ms": {
+                "p50":     round(self._p50.value() * 1000),
+                "p95":     round(self._p95.value() * 1000),
+                "p99":     round(self._p99.value() * 1000),
+                "samples": self._latency_samples,
+            },
+            "fix_success_rate_pct": fix_rate,
+            "api_health": {
+                "error_rate_pct":  err_rate,
+                "rate_limit_hits": self.rate_limit_hits,
+                "timeout_hits":    self.timeout_hits,
+                "parse_errors":    self.parse_errors,
+            },
+            "recent_sessions": recent,
+        }
+
+        self._snap_cache = (now_mono, snap)
+        return snap
+
+    def snapshot_json(self) -> bytes:
+        """
+        The snapshot pre-serialized with orjson. Re-encodes only when the
+        underlying snapshot was actually rebuilt (identity check), so a
+        scrape storm costs one dict build and one serialization per TTL.
+        """
+        snap = self.snapshot()
+        if snap is not self._json_src:
+            self._json_bytes = orjson.dumps(snap)
+            self._json_src   = snap
+        return self._json_bytes
+
+
+# Last (seconds, formatted) pair. Uptime only changes once per second, so
+# back-to-back snapshots within the same second skip the divmod/f-string
+# work. A single-entry memo beats lru_cache here: every new second is a
+# distinct key, so a real cache would churn at a 0% repeat hit rate.
+_fmt_last: tuple[int, str] = (-1, "")
 
 
 def _fmt_uptime(s: int) -> str:
+    global _fmt_last
+    if s == _fmt_last[0]:
+        return _fmt_last[1]
     h, r = divmod(s, 3600)
-    m, s = divmod(r, 60)
-    return f"{h}h {m}m {s}s" if h else (f"{m}m {s}s" if m else f"{s}s")
+    m, s2 = divmod(r, 60)
+    out = f"{h}h {m}m {s2}s" if h else (f"{m}m {s2}s" if m else f"{s2}s")
+    _fmt_last = (s, out)
+    return out
 
 
 store = MetricsStore()
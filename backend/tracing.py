@@ -1,7 +1,7 @@
 """
 Request ID Tracing — Lightweight correlation layer for AutoFixOps v2.
 
-Every inbound HTTP request receives a UUID4 request_id.
+Every inbound HTTP request receives a 128-bit random request_id.
 This ID is:
   - Stored in Python's contextvars (async-safe, no thread-local issues)
   - Injected into every log line via a custom logging filter
@@ -19,12 +19,10 @@ propagate it as a W3C traceparent header for distributed tracing."
 """
 
 import logging
-import uuid
+import os
 from contextvars import ContextVar
-from typing import Callable
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
 # ── Per-request context ────────────────────────────────────────────────────
@@ -33,6 +31,10 @@ from starlette.middleware.base import BaseHTTPMiddleware
 # Never use threading.local() in async code — it breaks under concurrent requests.
 request_id_var: ContextVar[str] = ContextVar("request_id", default="no-request-id")
 
+# Truncated form cached separately: the logging filter runs on every record,
+# and slicing [:8] there would allocate a fresh string per log line.
+request_id_short_var: ContextVar[str] = ContextVar("request_id_short", default="no-reque")
+
 
 def get_request_id() -> str:
     """Return the request ID for the currently executing coroutine."""
@@ -51,20 +53,39 @@ class RequestIDFilter(logging.Filter):
     """
 
     def filter(self, record: logging.LogRecord) -> bool:
-        record.request_id = get_request_id()[:8]   # First 8 chars keep logs readable
+        # One ContextVar lookup, zero string allocation per log line —
+        # the middleware pre-computed the 8-char form.
+        record.request_id = request_id_short_var.get()
         return True
 
 
+_CONFIGURED = False
+
+
 def configure_logging() -> None:
     """
     Apply the RequestIDFilter to the root logger.
-    Call once at application startup.
+
+    Idempotent: repeat calls (uvicorn reload, multiple lifespan runs under
+    test) return immediately instead of rebuilding handlers each time.
     """
+    global _CONFIGURED
+    if _CONFIGURED:
+        return
+    _CONFIGURED = True
+
+    # validate=False skips the per-field format-string validation pass —
+    # the format is a module literal, already proven at import time.
     fmt = logging.Formatter(
         "%(asctime)s [req=%(request_id)s] %(levelname)-5s %(name)s: %(message)s",
         datefmt="%H:%M:%S",
+        validate=False,
     )
     handler = logging.StreamHandler()
+    # Level set on the handler too: records suppressed here are dropped
+    # before the filter chain runs, so below-threshold logging never pays
+    # for the RequestIDFilter ContextVar lookup.
+    handler.setLevel(logging.INFO)
     handler.addFilter(RequestIDFilter())
     handler.setFormatter(fmt)
 
@@ -74,30 +95,95 @@ def configure_logging() -> None:
     root.setLevel(logging.INFO)
 
 
-# ── FastAPI middleware ─────────────────────────────────────────────────────
+# ── ASGI middleware ────────────────────────────────────────────────────────
 
-class RequestIDMiddleware(BaseHTTPMiddleware):
+def _parse_traceparent(value: bytes) -> str | None:
     """
-    Assigns a UUID4 to every request before any route handler runs.
+    Extract the 32-hex trace-id from a W3C traceparent header:
+        version-traceid-spanid-flags (fixed 55 chars)
+        e.g. 00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01
+    Returns None for anything malformed or the all-zero trace-id.
+    """
+    if len(value) != 55:
+        return None
+    parts = value.split(b"-")
+    if len(parts) != 4 or len(parts[1]) != 32:
+        return None
+    trace_id = parts[1]
+    if trace_id == b"0" * 32:
+        return None
+    try:
+        int(trace_id, 16)
+    except ValueError:
+        return None
+    return trace_id.decode("ascii")
+
+
+class RequestIDMiddleware:
+    """
+    Assigns a random 128-bit ID to every request before any route handler runs.
+
+    Pure ASGI — no BaseHTTPMiddleware, which wraps every request in an
+    extra task plus an anyio stream for body proxying. For a middleware
+    that only touches headers, speaking the protocol directly is several
+    times cheaper and keeps streaming responses working.
 
     Priority order for request ID:
-      1. X-Request-ID header from client (allows clients to pass their own IDs)
-      2. Auto-generated UUID4
+      1. trace-id from a W3C `traceparent` header — joins our logs with any
+         OpenTelemetry-compatible backend without changing the data model
+      2. X-Request-ID header from client (allows clients to pass their own IDs)
+      3. Auto-generated 128-bit random hex token
 
     The resolved ID is:
       - Set into request_id_var (accessible anywhere in the coroutine chain)
-      - Echoed back in X-Request-ID response header
+      - Echoed back in X-Request-ID (and traceparent, when applicable)
     """
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        req_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
-        token  = request_id_var.set(req_id)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # os.urandom(16).hex() gives 128 bits of randomness like uuid4 but
+        # skips UUID.__init__ field validation and dash formatting — the ID
+        # is only ever used as an opaque correlation token.
+        traceparent = None
+        incoming    = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value
+            elif name == b"x-request-id":
+                incoming = value
+
+        req_id   = None
+        if traceparent is not None:
+            req_id = _parse_traceparent(traceparent)
+        if req_id is None and incoming:
+            req_id = incoming.decode("latin-1")
+            traceparent = None
+        if req_id is None:
+            req_id = os.urandom(16).hex()
+            # Fresh trace: our generated ID doubles as the trace-id.
+            traceparent = f"00-{req_id}-{os.urandom(8).hex()}-01".encode("ascii")
+
+        token       = request_id_var.set(req_id)
+        short_token = request_id_short_var.set(req_id[:8])
+
+        extra_headers = [(b"x-request-id", req_id.encode("latin-1"))]
+        if traceparent is not None:
+            extra_headers.append((b"traceparent", traceparent))
+
+        async def send_with_header(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *extra_headers]
+            await send(message)
 
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_with_header)
         finally:
             # Always reset — prevents ID leaking to the next request on a reused worker
             request_id_var.reset(token)
-
-        response.headers["X-Request-ID"] = req_id
-        return response
+            request_id_short_var.reset(short_token)